@@ -1,12 +1,18 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta, timezone
+import numpy as np
 import pandas as pd
 import altair as alt
+import io
 import math
 import random
 from calendar import monthrange
+from urllib.parse import quote
 import gspread
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2.service_account import Credentials
 
 # ---------- カスタムCSS ----------
@@ -62,65 +68,254 @@ st.markdown(
 # セッションステートの初期化
 if 'saved' not in st.session_state:
     st.session_state.saved = False
+if 'pending_rows' not in st.session_state:
+    st.session_state.pending_rows = []
+if 'pending_unconfirmed' not in st.session_state:
+    st.session_state.pending_unconfirmed = False
 
 # ---------- 各種設定・関数 ----------
-def load_credentials():
+def _section(name):
+    # セクション自体が無い場合は None を返し、空のセクションと区別する
+    section = st.secrets.get(name)
+    return dict(section) if section is not None else None
+
+@st.cache_resource(ttl=300, show_spinner=False)
+def _secrets():
+    # st.secrets は読み込んだ内容を通常の dict に固定して使い回す（5分ごと、またはログイン失敗時に読み直す）
+    return (
+        _section("credentials"),
+        _section("goals"),
+        _section("google_service_account") or {},
+    )
+
+def load_secrets():
     try:
-        return st.secrets["credentials"]
+        return _secrets()
     except Exception:
+        return None, None, {}
+
+def load_credentials(secrets):
+    credentials = secrets[0]
+    if credentials is None:
         st.error("ログイン情報の読み込みに失敗しました。")
-        return {}
+        return frozenset()
+    # (ID, パスワード) の組で照合できるようにしておく
+    return frozenset(credentials.items())
 
-def load_goals():
-    try:
-        return st.secrets["goals"]
-    except Exception:
+def load_goals(secrets):
+    goals = secrets[1]
+    if goals is None:
         st.error("目標金額の読み込みに失敗しました。")
         return {}
+    return goals
 
-def get_exchange_rate(url="https://open.er-api.com/v6/latest/USD"):
+EXCHANGE_RATE_URL = "https://open.er-api.com/v6/latest/USD"
+
+@st.cache_resource(show_spinner=False)
+def get_http_session():
+    # 為替APIへの接続はプロセス内で使い回す（再実行ごとの TCP/TLS 再接続を避ける）
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=Retry(total=2, backoff_factor=0.3)),
+    )
+    return session
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_exchange_rate(url=EXCHANGE_RATE_URL):
+    response = get_http_session().get(url, timeout=3)
+    response.raise_for_status()
+    return response.json()["rates"]["JPY"]
+
+def get_exchange_rate(url=EXCHANGE_RATE_URL):
     try:
-        response = requests.get(url)
-        data = response.json()
-        return data["rates"]["JPY"]
+        rate = fetch_exchange_rate(url)
     except Exception:
+        # 取得失敗時は前回取得できたレートで続行する
+        if "last_rate" in st.session_state:
+            st.warning("為替レートの取得に失敗したため、前回のレートを使用します。")
+            return st.session_state["last_rate"]
         st.error("為替レートの取得に失敗しました。")
         return 0
+    st.session_state["last_rate"] = rate
+    return rate
 
 def calculate_rewards(usd, rate, reward_rate=0.6, tax_rate=0.1021):
-    before_tax = usd * rate * reward_rate
+    # usd はスカラーでも配列でもよい（配列ならまとめて計算し、配列で返す）
+    if np.ndim(usd) == 0:
+        # スカラーは int64 に丸めず、math.ceil で桁あふれのない int を返す
+        before_tax = usd * rate * reward_rate
+        tax = before_tax * tax_rate
+        after_tax = before_tax - tax
+        return math.ceil(before_tax), math.ceil(tax), math.ceil(after_tax)
+    before_tax = np.asarray(usd, dtype=float) * rate * reward_rate
     tax = before_tax * tax_rate
     after_tax = before_tax - tax
-    return math.ceil(before_tax), math.ceil(tax), math.ceil(after_tax)
+    return tuple(np.ceil(v).astype(np.int64) for v in (before_tax, tax, after_tax))
 
-def connect_to_sheet():
+SHEET_TITLE = "報酬管理シート（2025）"
+
+@st.cache_resource(show_spinner=False)
+def get_credentials():
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    return Credentials.from_service_account_info(load_secrets()[2], scopes=scope)
+
+@st.cache_resource(show_spinner=False)
+def get_authorized_session():
+    # Visualization API 用の HTTP セッションも使い回す
+    return AuthorizedSession(get_credentials())
+
+@st.cache_resource(show_spinner=False)
+def get_sheet_client():
+    # 認証済みクライアントはプロセス内で使い回す（再実行ごとの認証を避ける）
+    return gspread.authorize(get_credentials())
+
+@st.cache_resource(show_spinner=False)
+def open_worksheet(title=SHEET_TITLE):
+    return get_sheet_client().open(title).sheet1
+
+def connect_to_sheet():
     try:
-        creds = Credentials.from_service_account_info(st.secrets["google_service_account"], scopes=scope)
-        client = gspread.authorize(creds)
-        return client.open("報酬管理シート（2025）").sheet1
+        return open_worksheet()
     except Exception:
         st.error("Google スプレッドシートへの接続に失敗しました。")
         return None
 
+def reconnect_sheet():
+    # トークン切れなどでキャッシュした接続が使えなくなった場合に作り直す
+    open_worksheet.clear()
+    get_sheet_client.clear()
+    get_authorized_session.clear()
+    get_credentials.clear()
+    return connect_to_sheet()
+
+def is_auth_error(e):
+    return isinstance(e, gspread.exceptions.APIError) and e.response.status_code == 401
+
+def _append_rows(sheet, rows):
+    sheet.append_rows(rows, value_input_option="RAW", insert_data_option="INSERT_ROWS")
+
+def _drop_already_written(sheet, rows):
+    # (日付, 源氏名) の組がシートに既にある行は送信済みとみなす
+    written = {tuple(r[:2]) for r in sheet.get_values("A:B")}
+    return [row for row in rows if (row[0], row[1]) not in written]
+
+def _write_pending(sheet, rows):
+    if st.session_state.pending_unconfirmed:
+        rows = _drop_already_written(sheet, rows)
+    if rows:
+        _append_rows(sheet, rows)
+
+def flush_pending(sheet):
+    # 未送信の行をまとめて1回の API 呼び出しで書き込む（失敗時は次回に持ち越す）
+    rows = st.session_state.pending_rows
+    if not rows:
+        return True
+    try:
+        try:
+            _write_pending(sheet, rows)
+        except gspread.exceptions.APIError as e:
+            if not is_auth_error(e):
+                raise
+            sheet = reconnect_sheet()
+            if sheet is None:
+                return False
+            _write_pending(sheet, rows)
+    except gspread.exceptions.APIError:
+        # エラー応答が返った場合は書き込まれていない
+        return False
+    except Exception:
+        # タイムアウトや接続断では書き込まれた可能性があるため、次回は照合してから再送する
+        st.session_state.pending_unconfirmed = True
+        return False
+    st.session_state.pending_rows = []
+    st.session_state.pending_unconfirmed = False
+    _query_user_records.clear()
+    _fetch_all_records.clear()
+    return True
+
 def save_to_sheet(sheet, user_id, usd, rate, before_tax, tax, after_tax):
     JST = timezone(timedelta(hours=9))
     raw_date = datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")  # 保存用
     display_date = datetime.now(JST).strftime("%m月%d日 %H:%M")   # 表示用
     new_row = [raw_date, user_id, usd, round(rate, 1), before_tax, tax, after_tax]
-    try:
-        sheet.append_row(new_row)
+    st.session_state.pending_rows.append(new_row)
+    if flush_pending(sheet):
         st.success(f"✅ {display_date} に保存されました！")
+    else:
+        pending_count = len(st.session_state.pending_rows)
+        st.error(f"データの保存に失敗しました。未送信の {pending_count} 件は次回の保存時に再送信します。")
+
+NUMERIC_COLUMNS = ["ドル収益", "レート", "税引前報酬", "源泉徴収額", "税引後お給料"]
+
+def _coerce_numeric(df):
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _query_user_records(spreadsheet_id, sheet_title, user_id):
+    # Visualization API で該当ユーザーの行（B列＝源氏名）だけを取得する。
+    # 使えない結果は None として TTL の間キャッシュし、再実行ごとに問い合わせ直さない
+    try:
+        return _run_user_query(spreadsheet_id, sheet_title, user_id)
     except Exception:
-        st.error("データの保存に失敗しました。")
+        return None
 
-def load_records(sheet, user_id):
+def _run_user_query(spreadsheet_id, sheet_title, user_id):
+    query = f"select * where B = '{user_id}'"
+    url = (
+        f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/gviz/tq"
+        f"?tqx=out:csv&headers=1&sheet={quote(sheet_title)}&tq={quote(query)}"
+    )
+    response = get_authorized_session().get(url, timeout=5)
+    response.raise_for_status()
+    df = pd.read_csv(io.StringIO(response.text), dtype={"源氏名": str})
+    if "源氏名" not in df.columns or "日付" not in df.columns:
+        raise ValueError("unexpected gviz response")
+    df = _coerce_numeric(df)
+    # gviz は列ごとに型を1つに決め、少数派の型のセルを空で返すことがある。
+    # 日付や金額が欠けた行があれば信用せず、全件取得にフォールバックさせる
+    numeric_cols = [c for c in NUMERIC_COLUMNS if c in df.columns]
+    if pd.to_datetime(df["日付"], errors="coerce").isna().any() or df[numeric_cols].isna().any().any():
+        raise ValueError("incomplete gviz response")
+    return df
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_all_records(_sheet, spreadsheet_id):
+    # キャッシュキーはスプレッドシートID（Worksheet はハッシュできないため除外）
+    values = _sheet.get_all_values()
+    if not values:
+        return pd.DataFrame()
+    df = pd.DataFrame(values[1:], columns=values[0])
+    return _coerce_numeric(df)
+
+def _load_all_records(sheet):
     try:
-        records = sheet.get_all_records()
-        df = pd.DataFrame(records)
+        try:
+            return _fetch_all_records(sheet, sheet.spreadsheet.id)
+        except gspread.exceptions.APIError as e:
+            if not is_auth_error(e):
+                raise
+            sheet = reconnect_sheet()
+            if sheet is None:
+                return None
+            return _fetch_all_records(sheet, sheet.spreadsheet.id)
     except Exception:
         st.error("シートからのデータ取得に失敗しました。")
-        return pd.DataFrame()
+        return None
+
+def load_records(sheet, user_id):
+    df = None
+    # クエリ文字列に ' を含む源氏名はそのまま埋め込めないため全件取得で扱う
+    if "'" not in user_id:
+        df = _query_user_records(sheet.spreadsheet.id, sheet.title, user_id)
+    if df is None:
+        # 取得できなければシート全体の読み込みにフォールバックする
+        df = _load_all_records(sheet)
+        if df is None:
+            return pd.DataFrame()
 
     if "日付" in df.columns:
         df["日付"] = pd.to_datetime(df["日付"], errors="coerce")
@@ -130,74 +325,113 @@ def load_records(sheet, user_id):
 
     df = df[df["源氏名"] == user_id].sort_values("日付", ascending=False)
     df = df.drop(columns=["源氏名"]).reset_index(drop=True)
+    # 各表示関数で使う日付キーは一度だけ計算しておく
+    df["_ym"] = df["日付"].dt.to_period("M").astype(str)
     return df
 
-def display_history(df):
-    st.subheader("📚 過去の報酬履歴")
-    styled_df = df.copy().head(10)
-    for col in ["ドル収益", "税引前報酬", "源泉徴収額", "税引後お給料"]:
-        if col in styled_df.columns:
-            styled_df[col] = styled_df[col].apply(lambda x: f"{x:,.0f}")
-    if "レート" in styled_df.columns:
-        styled_df["レート"] = styled_df["レート"].apply(lambda x: f"{x:.1f}")
-    styled_df.index = range(1, len(styled_df) + 1)
-    st.table(styled_df)
+HISTORY_COLUMN_CONFIG = {
+    "ドル収益": st.column_config.NumberColumn(format="localized"),
+    "レート": st.column_config.NumberColumn(format="%.1f"),
+    "税引前報酬": st.column_config.NumberColumn(format="localized"),
+    "源泉徴収額": st.column_config.NumberColumn(format="localized"),
+    "税引後お給料": st.column_config.NumberColumn(format="yen"),
+}
+
+# 表示用キャッシュは記録の内容ごとに増えるため、件数に上限を設ける
+DISPLAY_CACHE_ENTRIES = 32
+
+def frame_key(df):
+    # 表示用の前処理キャッシュのキー（内容が同じなら同じ値になる）
+    return hash(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+
+@st.cache_data(max_entries=DISPLAY_CACHE_ENTRIES, show_spinner=False)
+def _prepare_history(_df, df_key, current_month):
+    df = _df
+    history_df = df.head(10).drop(columns=["_ym"])
+    history_df.index = range(1, len(history_df) + 1)
 
     recent_vals = df.head(10)["税引後お給料"]
     recent_vals = recent_vals[recent_vals > 0]
     recent_avg = recent_vals.mean() if not recent_vals.empty else 0
-    st.markdown(f"🧮 **直近10回の平均お給料：¥{math.ceil(recent_avg):,} 円**")
     max_salary = df["税引後お給料"].max()
-    st.markdown(f"👑 **過去最高お給料：¥{math.ceil(max_salary):,} 円**")
-    
-    # 今月の合計お給料と配信回数
-    current_month = datetime.now().strftime("%Y-%m")
-    this_month_df = df[df["日付"].dt.strftime("%Y-%m") == current_month]
+
+    this_month_df = df[df["_ym"] == current_month]
     monthly_total = this_month_df["税引後お給料"].sum()
     monthly_count = this_month_df.shape[0]
+    return history_df, recent_avg, max_salary, monthly_total, monthly_count
+
+def display_history(df, df_key):
+    st.subheader("📚 過去の報酬履歴")
+    current_month = datetime.now().strftime("%Y-%m")
+    history_df, recent_avg, max_salary, monthly_total, monthly_count = _prepare_history(
+        df, df_key, current_month
+    )
+    # 数値のまま渡し、桁区切りなどの書式はブラウザ側で適用する
+    st.dataframe(history_df, column_config=HISTORY_COLUMN_CONFIG, hide_index=False)
+
+    st.markdown(f"🧮 **直近10回の平均お給料：¥{math.ceil(recent_avg):,} 円**")
+    st.markdown(f"👑 **過去最高お給料：¥{math.ceil(max_salary):,} 円**")
+
+    # 今月の合計お給料と配信回数
     st.markdown(f"📅 **今月の合計お給料：¥{monthly_total:,} 円**")
     st.markdown(f"📌 **今月の配信回数：{monthly_count} 回**")
 
-def display_charts(df):
-    st.subheader("📈 近30日の報酬の推移")
-    recent_df = df.sort_values("日付").head(30).sort_values("日付")
-    if recent_df.empty:
-        st.info("表示するデータがありません。")
-        return
-    chart = alt.Chart(recent_df).mark_line(point=True).encode(
+@st.cache_data(max_entries=DISPLAY_CACHE_ENTRIES, show_spinner=False)
+def _prepare_recent(_df, df_key):
+    # load_records で日付の降順に並べ済みなので、先頭30件を反転するだけでよい
+    assert _df["日付"].dropna().is_monotonic_decreasing
+    # グラフに必要な列だけを送る
+    return _df.head(30).iloc[::-1][["日付", "税引後お給料"]]
+
+@st.cache_data(max_entries=DISPLAY_CACHE_ENTRIES, show_spinner=False)
+def _line_chart_spec(_recent_df, df_key):
+    # Altair のスキーマ検証は記録が変わったときだけ行い、結果の spec を使い回す
+    # 平均線も同じデータからチャート側で計算する
+    base = alt.Chart(_recent_df)
+    chart = base.mark_line(point=True).encode(
         x="日付:T",
         y="税引後お給料:Q",
         tooltip=["日付:T", "税引後お給料:Q"]
     ).properties(width=350, height=250)
-    avg = recent_df["税引後お給料"].mean()
-    avg_line = alt.Chart(pd.DataFrame({"平均": [avg]})).mark_rule(color="red").encode(
+    avg_line = base.transform_aggregate(
+        平均="mean(税引後お給料)"
+    ).mark_rule(color="red").encode(
         y="平均:Q"
     )
-    st.altair_chart(chart + avg_line, use_container_width=True)
+    return (chart + avg_line).to_dict()
 
-def display_monthly_bar_chart(df):
-    st.subheader("📊 月別の合計報酬（直近3ヶ月）")
-    df["月"] = df["日付"].dt.to_period("M").astype(str)
-    monthly_df = df.groupby("月")["税引後お給料"].sum().reset_index()
-    monthly_df = monthly_df.sort_values("月", ascending=False).head(3).sort_values("月")
-    bar = alt.Chart(monthly_df).mark_bar(color="#90caf9").encode(
+def display_charts(df, df_key):
+    st.subheader("📈 近30日の報酬の推移")
+    recent_df = _prepare_recent(df, df_key)
+    if recent_df.empty:
+        st.info("表示するデータがありません。")
+        return
+    st.vega_lite_chart(_line_chart_spec(recent_df, df_key), use_container_width=True)
+
+@st.cache_data(max_entries=DISPLAY_CACHE_ENTRIES, show_spinner=False)
+def _prepare_monthly(_df, df_key, current_month):
+    # 集計前に直近3ヶ月分の行だけに絞る
+    cutoff = (pd.Period(current_month, "M") - 2).start_time
+    recent = _df[_df["日付"] >= cutoff]
+    monthly_df = recent.groupby("_ym")["税引後お給料"].sum().reset_index(name="税引後お給料")
+    return monthly_df.rename(columns={"_ym": "月"}).sort_values("月")
+
+@st.cache_data(max_entries=DISPLAY_CACHE_ENTRIES, show_spinner=False)
+def _bar_chart_spec(_monthly_df, df_key, current_month):
+    bar = alt.Chart(_monthly_df).mark_bar(color="#90caf9").encode(
         x=alt.X("月:N", sort=None),
         y=alt.Y("税引後お給料:Q"),
         tooltip=["月", "税引後お給料"]
     ).properties(width=400, height=250)
-    st.altair_chart(bar, use_container_width=True)
+    return bar.to_dict()
 
-def display_calendar(df):
-    st.subheader("📆 今月の活動カレンダー")
-    today = datetime.now()
-    year = today.year
-    month = today.month
-    start_weekday, last_day = monthrange(year, month)
-    saved_dates = df["日付"].dt.strftime("%Y-%m-%d").tolist() if not df.empty else []
-    saved_set = set(saved_dates)
-    days_of_week = ["月", "火", "水", "木", "金", "土", "日"]
+def display_monthly_bar_chart(df, df_key):
+    st.subheader("📊 月別の合計報酬（直近3ヶ月）")
+    current_month = datetime.now().strftime("%Y-%m")
+    monthly_df = _prepare_monthly(df, df_key, current_month)
+    st.vega_lite_chart(_bar_chart_spec(monthly_df, df_key, current_month), use_container_width=True)
 
-    calendar_html = """
+CALENDAR_CSS = """
     <style>
         table.calendar {
             border-collapse: collapse;
@@ -218,44 +452,55 @@ def display_calendar(df):
             background-color: #222222;
         }
     </style>
-    <table class="calendar">
-      <tr>
-    """
-    for day in days_of_week:
-        calendar_html += f"<th>{day}</th>"
-    calendar_html += "</tr>"
+"""
+DAYS_OF_WEEK = ["月", "火", "水", "木", "金", "土", "日"]
+CALENDAR_HEADER = "".join(f"<th>{day}</th>" for day in DAYS_OF_WEEK)
+
+def _calendar_row(week):
+    return "<tr>" + "".join(f"<td>{cell}</td>" if cell != "" else "<td>&nbsp;</td>" for cell in week) + "</tr>"
 
+@st.cache_data(max_entries=DISPLAY_CACHE_ENTRIES, show_spinner=False)
+def _calendar_html(_df, df_key, year, month):
+    start_weekday, last_day = monthrange(year, month)
+    # 今月分の記録だけを日（整数）の集合にして照合する
+    ym = f"{year:04d}-{month:02d}"
+    saved_days = set(_df.loc[_df["_ym"] == ym, "日付"].dt.day) if not _df.empty else set()
+
+    rows = []
     week = [""] * start_weekday
     for d in range(1, last_day + 1):
-        day_str = datetime(year, month, d).strftime("%Y-%m-%d")
-        mark = "🌟" if day_str in saved_set else ""
-        week.append(f"{d}{mark}")
+        week.append(f"{d}🌟" if d in saved_days else str(d))
         if len(week) == 7:
-            calendar_html += "<tr>" + "".join(
-                [f"<td>{cell}</td>" if cell != "" else "<td>&nbsp;</td>" for cell in week]
-            ) + "</tr>"
+            rows.append(_calendar_row(week))
             week = []
     if week:
-        while len(week) < 7:
-            week.append("")
-        calendar_html += "<tr>" + "".join(
-            [f"<td>{cell}</td>" if cell != "" else "<td>&nbsp;</td>" for cell in week]
-        ) + "</tr>"
-    calendar_html += "</table>"
+        week += [""] * (7 - len(week))
+        rows.append(_calendar_row(week))
+    return CALENDAR_CSS + f"<table class=\"calendar\"><tr>{CALENDAR_HEADER}</tr>{''.join(rows)}</table>"
+
+def display_calendar(df, df_key):
+    st.subheader("📆 今月の活動カレンダー")
+    today = datetime.now()
+    calendar_html = _calendar_html(df, df_key, today.year, today.month)
     st.markdown(calendar_html, unsafe_allow_html=True)
 
-def display_simulator(df, user_id):
+def display_simulator(df, df_key, user_id):
     st.subheader("🧠 あと何回出ればどれくらい？シミュレーター")
-    current_month = datetime.now().strftime("%Y-%m")
-    this_month_df = df[df["日付"].dt.strftime("%Y-%m") == current_month]
-    current_total = this_month_df["税引後お給料"].sum()
-    avg_salary = df["税引後お給料"].mean()
+    now = datetime.now()
+    current_month = now.strftime("%Y-%m")
+    # 回数の入力で再実行されても、記録が変わらなければ集計し直さない
+    sim_key = (df_key, current_month)
+    if "sim_ctx" not in st.session_state or st.session_state.sim_df_key != sim_key:
+        this_month_df = df[df["_ym"] == current_month]
+        current_total = this_month_df["税引後お給料"].sum()
+        avg_salary = df["税引後お給料"].mean()
+        last_day = now.replace(day=monthrange(now.year, now.month)[1]).strftime("%m月%d日")
+        st.session_state.sim_ctx = (current_total, avg_salary, last_day)
+        st.session_state.sim_df_key = sim_key
+    current_total, avg_salary, last_day = st.session_state.sim_ctx
 
     future_sessions = st.number_input("例えば今月あと何回配信すると？", min_value=0, max_value=30, value=3, key="simulator_sessions")
     projected_total = current_total + avg_salary * future_sessions
-    last_day = datetime.now().replace(
-        day=monthrange(datetime.now().year, datetime.now().month)[1]
-    ).strftime("%m月%d日")
 
     st.markdown(
         f"📅 {last_day} 時点で、{user_id} さんの予測お給料は **¥{int(projected_total):,} 円** になりそうです！"
@@ -269,14 +514,21 @@ def main():
     st.title("🔐 ライバー専用｜報酬計算ツール (Ver.10.7.3)")
     st.subheader("👤 ログイン")
 
-    credentials_dict = load_credentials()
-    goals = load_goals()
+    secrets = load_secrets()
+    credentials = load_credentials(secrets)
+    goals = load_goals(secrets)
 
     user_id = st.text_input("ID（源氏名）を入力してください")
     user_pass = st.text_input("Password（パスワード）を入力してください", type="password")
 
+    # 一致しない場合は、secrets の更新（ライバーの追加やパスワード変更）を反映してから判定し直す
+    if user_id and user_pass and (user_id, user_pass) not in credentials:
+        _secrets.clear()
+        secrets = load_secrets()
+        credentials = frozenset((secrets[0] or {}).items())
+
     # ログイン判定
-    if user_id in credentials_dict and credentials_dict[user_id] == user_pass:
+    if (user_id, user_pass) in credentials:
         st.success("✅ ログイン成功しました！")
 
         sheet = connect_to_sheet()
@@ -293,6 +545,9 @@ def main():
             usd = float(usd_input)
         except Exception:
             usd = 0.0
+        # "nan" や "inf" も float として解釈できてしまうため除外する
+        if not math.isfinite(usd):
+            usd = 0.0
 
         before_tax, tax, after_tax = calculate_rewards(usd, rate)
 
@@ -325,11 +580,13 @@ def main():
             if df.empty:
                 st.info("まだ記録がありません。")
             else:
-                display_history(df)
-                display_charts(df)
-                display_monthly_bar_chart(df)
-                display_calendar(df)
-                display_simulator(df, user_id)
+                # 入力値の変更による再実行では前処理済みの結果を再利用する
+                df_key = frame_key(df)
+                display_history(df, df_key)
+                display_charts(df, df_key)
+                display_monthly_bar_chart(df, df_key)
+                display_calendar(df, df_key)
+                display_simulator(df, df_key, user_id)
 
     else:
         if user_id and user_pass: